@@ -0,0 +1,93 @@
+import itertools
+import os
+import threading
+from typing import NamedTuple
+
+import msgspec
+import zstandard as zstd
+
+# zstd (de)compressor objects are not safe for concurrent use, so keep one per thread.
+_codec_local = threading.local()
+
+
+class DocHeader(NamedTuple):
+    id: str
+    filename: str
+    text_length: int
+
+
+class DocRecord(msgspec.Struct, frozen=True):
+    header: DocHeader  # The /api/documents list entry
+    compressed_text: bytes
+    response_json: bytes  # Serialized upload / GET /api/documents/{id} body
+
+
+def compress_text(text: str) -> bytes:
+    compressor = getattr(_codec_local, "compressor", None)
+    if compressor is None:
+        compressor = _codec_local.compressor = zstd.ZstdCompressor(level=3)
+    return compressor.compress(text.encode("utf-8"))
+
+
+def decompress_text(compressed_text: bytes) -> str:
+    decompressor = getattr(_codec_local, "decompressor", None)
+    if decompressor is None:
+        decompressor = _codec_local.decompressor = zstd.ZstdDecompressor()
+    return decompressor.decompress(compressed_text).decode("utf-8")
+
+
+class ShardedDocStore:
+    """In-memory document store split into independently locked shards.
+
+    Each entry carries an upload sequence number so listings can be returned in upload
+    order, and each shard counts its writes so callers can tell when a listing is stale.
+    """
+
+    def __init__(self, shard_count: int | None = None) -> None:
+        count = shard_count or 4 * (os.cpu_count() or 1)
+        self.shards: list[dict[str, tuple[int, DocRecord]]] = [{} for _ in range(count)]
+        self.locks: list[threading.Lock] = [threading.Lock() for _ in range(count)]
+        self.shard_versions: list[int] = [0] * count
+        self._sequence = itertools.count()
+
+    def _index(self, doc_id: str) -> int:
+        return hash(doc_id) % len(self.shards)
+
+    def __setitem__(self, doc_id: str, document: DocRecord) -> None:
+        sequence = next(self._sequence)
+        index = self._index(doc_id)
+        with self.locks[index]:
+            self.shards[index][doc_id] = (sequence, document)
+            self.shard_versions[index] += 1
+
+    def get(self, doc_id: str, default: DocRecord | None = None) -> DocRecord | None:
+        index = self._index(doc_id)
+        with self.locks[index]:
+            entry = self.shards[index].get(doc_id)
+        return default if entry is None else entry[1]
+
+    def pop(self, doc_id: str, default: DocRecord | None = None) -> DocRecord | None:
+        index = self._index(doc_id)
+        with self.locks[index]:
+            entry = self.shards[index].pop(doc_id, None)
+            if entry is None:
+                return default
+            self.shard_versions[index] += 1
+        return entry[1]
+
+    def versions(self) -> tuple[int, ...]:
+        return tuple(self.shard_versions)
+
+    def headers(self) -> tuple[tuple[int, ...], list[DocHeader]]:
+        """Return the shard versions seen and all headers in upload order.
+
+        Shards are locked one at a time, so the versions describe exactly what was read.
+        """
+        versions: list[int] = []
+        entries: list[tuple[int, DocHeader]] = []
+        for index, (shard, lock) in enumerate(zip(self.shards, self.locks)):
+            with lock:
+                versions.append(self.shard_versions[index])
+                entries.extend((sequence, record.header) for sequence, record in shard.values())
+        entries.sort(key=lambda entry: entry[0])
+        return tuple(versions), [header for _, header in entries]
@@ -0,0 +1,188 @@
+import codecs
+import io
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Iterable
+
+import docx
+import fitz
+import pypdf
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+PDF_WORKERS = os.cpu_count() or 1
+PDF_PAGES_PER_TASK = 8
+PDF_INLINE_PAGE_LIMIT = 16  # Smaller PDFs are parsed inline; worker overhead would dominate.
+
+
+def _new_pdf_executor() -> ProcessPoolExecutor:
+    # forkserver, not fork: forking a threaded server could copy a held MuPDF/allocator lock.
+    return ProcessPoolExecutor(
+        max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("forkserver")
+    )
+
+
+# Created on first use, not at import: forkserver workers import this module too.
+pdf_executor: ProcessPoolExecutor | None = None
+_pdf_executor_lock = threading.Lock()
+
+
+def _get_pdf_executor() -> ProcessPoolExecutor:
+    global pdf_executor
+    with _pdf_executor_lock:
+        if pdf_executor is None:
+            pdf_executor = _new_pdf_executor()
+        return pdf_executor
+
+
+def _warm_pdf_worker() -> None:
+    # A no-op task; submitting it only forces the pool to start a worker process.
+    fitz.open().close()
+
+
+def start_pdf_workers() -> None:
+    executor = _get_pdf_executor()
+    for _ in range(PDF_WORKERS):
+        executor.submit(_warm_pdf_worker)
+
+
+def shutdown_pdf_workers() -> None:
+    global pdf_executor
+    with _pdf_executor_lock:
+        executor, pdf_executor = pdf_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _discard_broken_pdf_executor(broken: ProcessPoolExecutor) -> None:
+    """Drop a pool whose worker died (e.g. a MuPDF crash or OOM kill); the next use rebuilds it."""
+    global pdf_executor
+    with _pdf_executor_lock:
+        if pdf_executor is broken:
+            pdf_executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_text_from_pdf_with_pypdf(file_bytes: bytes) -> str:
+    reader = pypdf.PdfReader(io.BytesIO(file_bytes))
+    return "\n".join((page.extract_text() or "") for page in reader.pages)
+
+
+def _attach_shared_memory(shm_name: str) -> shared_memory.SharedMemory:
+    # The parent owns and unlinks the segment. Before 3.13 attaching also registers it, but
+    # forkserver workers share the parent's resource tracker, so that is a harmless duplicate.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=shm_name, track=False)
+    return shared_memory.SharedMemory(name=shm_name)
+
+
+def _extract_page_range(shm_name: str, size: int, start: int, end: int) -> str:
+    shm = _attach_shared_memory(shm_name)
+    try:
+        with fitz.open(stream=bytes(shm.buf[:size]), filetype="pdf") as pdf:
+            return "\n".join(
+                pdf[index].get_text("text", sort=False) for index in range(start, end)
+            )
+    finally:
+        shm.close()
+
+
+def _map_on_pdf_pool(fn: Callable[..., str], *iterables: Iterable[Any]) -> list[str]:
+    """Map fn on the PDF pool, replacing the pool if a worker died.
+
+    The failing PDF may be what crashed the worker, so it is not retried on the new pool;
+    the caller falls back to pypdf instead.
+    """
+    executor = _get_pdf_executor()
+    try:
+        return list(executor.map(fn, *iterables))
+    except BrokenProcessPool:
+        _discard_broken_pdf_executor(executor)
+        raise
+
+
+def extract_text_from_pdf_with_pymupdf(file_bytes: bytes) -> str:
+    with fitz.open(stream=file_bytes, filetype="pdf") as pdf:
+        page_count = pdf.page_count
+        if page_count <= PDF_INLINE_PAGE_LIMIT:
+            return "\n".join(page.get_text("text", sort=False) for page in pdf)
+
+    starts = range(0, page_count, PDF_PAGES_PER_TASK)
+    ends = [min(start + PDF_PAGES_PER_TASK, page_count) for start in starts]
+    # Share one copy of the PDF with the workers instead of pickling it into every task.
+    shm = shared_memory.SharedMemory(create=True, size=len(file_bytes))
+    try:
+        shm.buf[: len(file_bytes)] = file_bytes
+        results = _map_on_pdf_pool(
+            _extract_page_range,
+            repeat(shm.name),
+            repeat(len(file_bytes)),
+            starts,
+            ends,
+        )
+        return "\n".join(results)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def extract_text_from_pdf(file: BinaryIO) -> str:
+    file_bytes = file.read()
+    try:
+        return extract_text_from_pdf_with_pymupdf(file_bytes)
+    except Exception:
+        # PyMuPDF is much faster, but keep pypdf around for files it rejects.
+        logger.exception("PyMuPDF failed to extract PDF text; falling back to pypdf")
+
+    try:
+        return extract_text_from_pdf_with_pypdf(file_bytes)
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail="Failed to parse PDF file.") from exc
+
+
+def extract_text_from_docx(file: BinaryIO) -> str:
+    try:
+        document = docx.Document(file)
+        return "\n".join(paragraph.text for paragraph in document.paragraphs)
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail="Failed to parse DOCX/DOC file.") from exc
+
+
+def extract_text_from_txt(file: BinaryIO) -> str:
+    # utf-8-sig strips a leading BOM; invalid bytes become U+FFFD instead of failing the upload.
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pieces: list[str] = []
+    while chunk := file.read(UPLOAD_CHUNK_SIZE):
+        pieces.append(decoder.decode(chunk))
+    pieces.append(decoder.decode(b"", final=True))
+    return "".join(pieces)
+
+
+# Bump whenever an extractor's output changes so stale cached extractions are ignored.
+EXTRACTOR_CACHE_VERSION = 1
+EXTRACTORS: dict[str, Callable[[BinaryIO], str]] = {
+    ".pdf": extract_text_from_pdf,
+    ".docx": extract_text_from_docx,
+    ".doc": extract_text_from_docx,
+    ".txt": extract_text_from_txt,
+}
+
+
+def get_extractor(filename: str) -> Callable[[BinaryIO], str]:
+    extractor = EXTRACTORS.get(Path(filename).suffix.lower())
+    if extractor is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Unsupported file type. Supported types: .pdf, .docx, .doc, .txt",
+        )
+    return extractor
@@ -1,21 +1,64 @@
-import io
+import asyncio
+import hashlib
+import json
 import os
+import threading
 import uuid
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from pathlib import Path
+from types import MappingProxyType
+from typing import Any, BinaryIO, Callable
 
-import docx
-import pypdf
-from fastapi import FastAPI, File, HTTPException, UploadFile, WebSocket
+import msgspec
+import orjson
+from fastapi import FastAPI, File, HTTPException, Request, Response, UploadFile, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-
+from starlette.concurrency import run_in_threadpool
+
+from document_store import DocHeader, DocRecord, ShardedDocStore, compress_text, decompress_text
+from extractors import (
+    EXTRACTOR_CACHE_VERSION,
+    UPLOAD_CHUNK_SIZE,
+    get_extractor,
+    shutdown_pdf_workers,
+    start_pdf_workers,
+)
 from rlm_pipeline import query_document
 from ws_handler import handle_query_ws
 
-app = FastAPI(title="RLM Document Explorer API")
-documents: dict[str, dict] = {}  # Global dict: id -> {id, filename, text, text_length, preview}
-SUPPORTED_EXTENSIONS: set[str] = {".pdf", ".docx", ".doc", ".txt"}
-PROVIDER_MODELS: dict[str, dict] = {
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    # Start the PDF workers now instead of on the first large upload.
+    start_pdf_workers()
+    await asyncio.to_thread(seed_cache_dir_bytes)
+    yield
+    shutdown_pdf_workers()
+
+
+app = FastAPI(title="RLM Document Explorer API", lifespan=lifespan)
+documents = ShardedDocStore()  # id -> DocRecord
+PREVIEW_LENGTH = 500
+CACHE_DIR = Path(
+    os.environ.get("RLM_CACHE_DIR", "").strip() or Path(__file__).parent / ".cache" / "extractions"
+)
+CACHE_DIR_MAX_BYTES = int(os.environ.get("RLM_CACHE_DIR_MAX_BYTES", str(512 << 20)))
+EXTRACTION_CACHE_MAX_BYTES = int(os.environ.get("RLM_EXTRACTION_CACHE_BYTES", str(64 << 20)))
+
+
+def freeze(value: Any) -> Any:
+    """Recursively turn dicts into read-only mapping proxies and lists into tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+PROVIDER_MODELS = freeze({
     "gemini": {
         "label": "Google Gemini",
         "api_key_name": "Google API Key",
@@ -50,16 +93,47 @@ PROVIDER_MODELS: dict[str, dict] = {
         ],
         "default": "claude-sonnet-4-5",
     },
-}
+})
+PROVIDERS_JSON = orjson.dumps(PROVIDER_MODELS, default=dict)
+
+
+@dataclass(frozen=True, slots=True)
+class CachedExtraction:
+    compressed_text: bytes
+    text_length: int
+    preview: str
 
 
-class QueryRequest(BaseModel):
+# LRU of cache key -> extracted text, bounded by total compressed size.
+extraction_cache: OrderedDict[str, CachedExtraction] = OrderedDict()
+extraction_cache_bytes = 0
+extraction_cache_lock = threading.Lock()
+cache_dir_bytes: int | None = None  # Running size of CACHE_DIR; seeded at startup
+cache_dir_lock = threading.Lock()
+# Serialized /api/documents body, tagged with the shard versions it was built from.
+list_cache: tuple[tuple[int, ...], bytes] | None = None
+
+
+def build_cached_extraction(text: str) -> CachedExtraction:
+    # The preview is sliced once here and shared by every record uploaded with this content.
+    return CachedExtraction(
+        compressed_text=compress_text(text),
+        text_length=len(text),
+        preview=text[:PREVIEW_LENGTH],
+    )
+
+
+class QueryRequest(msgspec.Struct):
     document_id: str
     question: str
     api_key: str
     model: str
 
 
+# /api/query decodes its body manually, so document the body in the OpenAPI schema by hand.
+QUERY_REQUEST_SCHEMA = msgspec.json.schema_components([QueryRequest])[1]["QueryRequest"]
+
+
 def get_allowed_origins() -> list[str]:
     configured = os.environ.get("CORS_ALLOWED_ORIGINS", "").strip()
     if configured:
@@ -89,114 +163,194 @@ def health() -> dict[str, str]:
 
 
 @app.get("/api/providers")
-def list_providers() -> dict[str, dict]:
-    return PROVIDER_MODELS
-
-
-def extract_text_from_pdf(file_bytes: bytes) -> str:
+def list_providers() -> Response:
+    return Response(content=PROVIDERS_JSON, media_type="application/json")
+
+
+def compute_file_hash(file: BinaryIO) -> str:
+    """Hash an upload in fixed-size chunks, then rewind it for extraction."""
+    hasher = hashlib.sha256()
+    while chunk := file.read(UPLOAD_CHUNK_SIZE):
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()
+
+
+def extraction_cache_key(extractor: Callable[[BinaryIO], str], content_hash: str) -> str:
+    # The same bytes extract differently per format (.doc and .docx share an extractor).
+    return f"v{EXTRACTOR_CACHE_VERSION}-{extractor.__name__}-{content_hash}"
+
+
+def remember_extraction(cache_key: str, cached: CachedExtraction) -> None:
+    global extraction_cache_bytes
+    with extraction_cache_lock:
+        previous = extraction_cache.pop(cache_key, None)
+        if previous is not None:
+            extraction_cache_bytes -= len(previous.compressed_text)
+        extraction_cache[cache_key] = cached
+        extraction_cache_bytes += len(cached.compressed_text)
+        while extraction_cache_bytes > EXTRACTION_CACHE_MAX_BYTES and extraction_cache:
+            _, evicted = extraction_cache.popitem(last=False)
+            extraction_cache_bytes -= len(evicted.compressed_text)
+
+
+def scan_cache_dir() -> list[tuple[float, int, Path]]:
+    entries: list[tuple[float, int, Path]] = []
+    for cache_file in CACHE_DIR.glob("*.json"):
+        try:
+            stat = cache_file.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, cache_file))
+    return entries
+
+
+def seed_cache_dir_bytes() -> None:
+    global cache_dir_bytes
+    with cache_dir_lock:
+        if cache_dir_bytes is None:
+            cache_dir_bytes = sum(size for _, size, _ in scan_cache_dir())
+
+
+def prune_cache_dir() -> int:
+    """Delete the least recently used cache files until the directory fits its budget.
+
+    Returns the resulting directory size, which also resyncs the running total.
+    """
+    entries = scan_cache_dir()
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, cache_file in sorted(entries):
+        if total_bytes <= CACHE_DIR_MAX_BYTES:
+            break
+        cache_file.unlink(missing_ok=True)
+        total_bytes -= size
+    return total_bytes
+
+
+def record_cache_write(added_bytes: int) -> None:
+    """Update the running cache size; scan and prune only once it exceeds the budget."""
+    global cache_dir_bytes
+    seed_cache_dir_bytes()
+    with cache_dir_lock:
+        cache_dir_bytes = (cache_dir_bytes or 0) + added_bytes
+        if cache_dir_bytes > CACHE_DIR_MAX_BYTES:
+            cache_dir_bytes = prune_cache_dir()
+
+
+def load_cached_extraction(cache_key: str) -> CachedExtraction | None:
+    """Look up extracted text by cache key, falling back to the on-disk cache."""
+    with extraction_cache_lock:
+        cached = extraction_cache.get(cache_key)
+        if cached is not None:
+            extraction_cache.move_to_end(cache_key)
+            return cached
+
+    cache_file = CACHE_DIR / f"{cache_key}.json"
     try:
-        reader = pypdf.PdfReader(io.BytesIO(file_bytes))
-        return "\n".join((page.extract_text() or "") for page in reader.pages)
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail="Failed to parse PDF file.") from exc
+        payload = json.loads(cache_file.read_text(encoding="utf-8"))
+        cached = build_cached_extraction(payload["text"])
+        # Refresh the mtime so pruning treats this file as recently used.
+        os.utime(cache_file)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
 
-
-def extract_text_from_docx(file_bytes: bytes) -> str:
-    try:
-        document = docx.Document(io.BytesIO(file_bytes))
-        return "\n".join(paragraph.text for paragraph in document.paragraphs)
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail="Failed to parse DOCX/DOC file.") from exc
+    remember_extraction(cache_key, cached)
+    return cached
 
 
-def extract_text_from_txt(file_bytes: bytes) -> str:
+def store_cached_extraction(cache_key: str, text: str) -> CachedExtraction:
+    cached = build_cached_extraction(text)
+    remember_extraction(cache_key, cached)
     try:
-        return file_bytes.decode("utf-8")
-    except UnicodeDecodeError as exc:
-        raise HTTPException(status_code=400, detail="TXT files must be UTF-8 encoded.") from exc
-
-
-def extract_text(filename: str, file_bytes: bytes) -> str:
-    extension = Path(filename).suffix.lower()
-    if extension not in SUPPORTED_EXTENSIONS:
-        raise HTTPException(
-            status_code=400,
-            detail="Unsupported file type. Supported types: .pdf, .docx, .doc, .txt",
-        )
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        cache_file = CACHE_DIR / f"{cache_key}.json"
+        payload = json.dumps({"text": text}).encode("utf-8")
+        try:
+            previous_size = cache_file.stat().st_size
+        except FileNotFoundError:
+            previous_size = 0
+        cache_file.write_bytes(payload)
+        record_cache_write(len(payload) - previous_size)
+    except OSError:
+        # The in-memory entry is still usable; the disk cache is best-effort.
+        pass
+    return cached
+
+
+def load_or_extract(extractor: Callable[[BinaryIO], str], file: BinaryIO) -> CachedExtraction:
+    cache_key = extraction_cache_key(extractor, compute_file_hash(file))
+    cached = load_cached_extraction(cache_key)
+    if cached is not None:
+        return cached
+
+    extracted_text = extractor(file)
+    if not extracted_text.strip():
+        raise HTTPException(status_code=400, detail="Extracted text is empty.")
 
-    if extension == ".pdf":
-        return extract_text_from_pdf(file_bytes)
-    if extension in {".docx", ".doc"}:
-        return extract_text_from_docx(file_bytes)
-    return extract_text_from_txt(file_bytes)
+    return store_cached_extraction(cache_key, extracted_text)
 
 
 @app.post("/api/upload")
-async def upload_document(file: UploadFile = File(...)) -> dict[str, str | int]:
+async def upload_document(file: UploadFile = File(...)) -> Response:
     if not file.filename:
         raise HTTPException(status_code=400, detail="Uploaded file must include a filename.")
 
-    file_bytes = await file.read()
-    extracted_text = extract_text(file.filename, file_bytes)
-    if not extracted_text.strip():
-        raise HTTPException(status_code=400, detail="Extracted text is empty.")
+    extractor = get_extractor(file.filename)
+    # Hashing, parsing and compression are CPU/IO-bound; keep them off the event loop.
+    cached = await asyncio.to_thread(load_or_extract, extractor, file.file)
 
     document_id = str(uuid.uuid4())
-    preview = extracted_text[:500]
-    document_record: dict[str, str | int] = {
-        "id": document_id,
-        "filename": file.filename,
-        "text": extracted_text,
-        "text_length": len(extracted_text),
-        "preview": preview,
-    }
-    documents[document_id] = document_record
-
-    return {
-        "id": document_id,
-        "filename": file.filename,
-        "text_length": len(extracted_text),
-        "preview": preview,
-    }
+    # Upload and GET /api/documents/{id} return the same body, so serialize it once.
+    response_json = orjson.dumps(
+        {
+            "id": document_id,
+            "filename": file.filename,
+            "text_length": cached.text_length,
+            "preview": cached.preview,
+        }
+    )
+    documents[document_id] = DocRecord(
+        header=DocHeader(document_id, file.filename, cached.text_length),
+        compressed_text=cached.compressed_text,
+        response_json=response_json,
+    )
+
+    return Response(content=response_json, media_type="application/json")
 
 
 @app.get("/api/documents")
-def list_documents() -> list[dict[str, str | int]]:
-    return [
-        {
-            "id": document["id"],
-            "filename": document["filename"],
-            "text_length": document["text_length"],
-        }
-        for document in documents.values()
-    ]
+def list_documents() -> Response:
+    global list_cache
+    cached = list_cache
+    if cached is not None and cached[0] == documents.versions():
+        body = cached[1]
+    else:
+        # A write racing this rebuild bumps a shard version, so the next call rebuilds again.
+        versions, headers = documents.headers()
+        body = orjson.dumps([header._asdict() for header in headers])
+        list_cache = (versions, body)
+
+    return Response(content=body, media_type="application/json")
 
 
 @app.delete("/api/documents/{doc_id}")
 def delete_document(doc_id: str) -> dict[str, str]:
-    if doc_id not in documents:
+    if documents.pop(doc_id) is None:
         raise HTTPException(status_code=404, detail="Document not found.")
 
-    del documents[doc_id]
     return {"status": "deleted"}
 
 
 @app.get("/api/documents/{doc_id}")
-def get_document(doc_id: str) -> dict[str, str | int]:
+def get_document(doc_id: str) -> Response:
     document = documents.get(doc_id)
     if document is None:
         raise HTTPException(status_code=404, detail="Document not found.")
 
-    return {
-        "id": document["id"],
-        "filename": document["filename"],
-        "text_length": document["text_length"],
-        "preview": document["preview"],
-    }
+    return Response(content=document.response_json, media_type="application/json")
 
 
-@app.post("/api/query")
-def query_document_endpoint(request: QueryRequest) -> dict:
+def run_query(request: QueryRequest) -> dict:
     if not request.question.strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
     if not request.api_key.strip():
@@ -216,7 +370,7 @@ def query_document_endpoint(request: QueryRequest) -> dict:
 
     try:
         return query_document(
-            str(document.get("text", "")),
+            decompress_text(document.compressed_text),
             request.question,
             request.model,
             request.api_key,
@@ -225,6 +379,25 @@ def query_document_endpoint(request: QueryRequest) -> dict:
         raise HTTPException(status_code=500, detail=f"Query failed: {exc}") from exc
 
 
+@app.post(
+    "/api/query",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": QUERY_REQUEST_SCHEMA}},
+        }
+    },
+)
+async def query_document_endpoint(http_request: Request) -> dict:
+    try:
+        request = msgspec.json.decode(await http_request.body(), type=QueryRequest)
+    except msgspec.DecodeError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+
+    # Same anyio thread pool a sync endpoint would use, separate from upload extraction.
+    return await run_in_threadpool(run_query, request)
+
+
 @app.websocket("/ws/query")
 async def ws_query(websocket: WebSocket) -> None:
     await handle_query_ws(websocket, documents)
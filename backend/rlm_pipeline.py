@@ -1,12 +1,15 @@
 import logging
 import os
 import shutil
+import threading
 import time
 from pathlib import Path
 
 import dspy
 
 logger = logging.getLogger(__name__)
+_deno_ok: bool = False
+_deno_lock = threading.Lock()
 
 
 class DocumentQA(dspy.Signature):
@@ -21,6 +24,18 @@ class DocumentQA(dspy.Signature):
 
 
 def _ensure_deno_available() -> None:
+    global _deno_ok
+    if _deno_ok:
+        return
+
+    with _deno_lock:
+        if _deno_ok:
+            return
+        _locate_deno()
+        _deno_ok = True
+
+
+def _locate_deno() -> None:
     if shutil.which("deno"):
         return
 
@@ -1,82 +1,108 @@
 import asyncio
 import logging
+import os
 from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
+import orjson
+from document_store import ShardedDocStore, decompress_text
 from fastapi import WebSocket, WebSocketDisconnect
 from rlm_pipeline import query_document
 
 logger = logging.getLogger(__name__)
-executor = ThreadPoolExecutor(max_workers=2)
+MAX_WORKERS = int(os.getenv("RLM_WORKERS", "8"))
+QUERY_SLOT_TIMEOUT_S = float(os.getenv("RLM_QUEUE_TIMEOUT_S", "30"))
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+query_slots = asyncio.Semaphore(MAX_WORKERS)
+# Iteration frames share a constant envelope; only the entry itself is encoded per frame.
+ITERATION_PREFIX = b'{"type":"iteration","data":'
+ITERATION_SUFFIX = b"}"
 
 
-async def handle_query_ws(websocket: WebSocket, documents: dict[str, dict[str, Any]]) -> None:
+def query_compressed_document(
+    compressed_text: bytes, question: str, model: str, api_key: str
+) -> dict:
+    """Decompress the document text on the worker thread, then run the RLM query."""
+    return query_document(decompress_text(compressed_text), question, model, api_key)
+
+
+async def send_event(websocket: WebSocket, event_type: str, data: dict[str, Any]) -> None:
+    """Send one `{type, data}` event as an orjson-encoded binary frame."""
+    await websocket.send_bytes(orjson.dumps({"type": event_type, "data": data}))
+
+
+def get_str_field(data: dict[str, Any], key: str) -> str:
+    """Return a stripped string field; missing or non-string values count as empty."""
+    value = data.get(key)
+    return value.strip() if isinstance(value, str) else ""
+
+
+async def handle_query_ws(websocket: WebSocket, documents: ShardedDocStore) -> None:
     """Handle one WebSocket query session with trajectory replay streaming."""
     await websocket.accept()
 
     try:
         data = await websocket.receive_json()
-        document_id = str(data.get("document_id", "")).strip()
-        question = str(data.get("question", "")).strip()
-        api_key = str(data.get("api_key", "")).strip()
-        model = str(data.get("model", "")).strip()
+        document_id = get_str_field(data, "document_id")
+        question = get_str_field(data, "question")
+        api_key = get_str_field(data, "api_key")
+        model = get_str_field(data, "model")
 
         if not document_id or not question:
-            await websocket.send_json(
-                {
-                    "type": "error",
-                    "data": {"message": "Both document_id and question are required"},
-                }
+            await send_event(
+                websocket, "error", {"message": "Both document_id and question are required"}
             )
             return
         if not api_key:
-            await websocket.send_json(
-                {
-                    "type": "error",
-                    "data": {
-                        "message": (
-                            "API key is required. Please configure your API key in Settings."
-                        )
-                    },
-                }
+            await send_event(
+                websocket,
+                "error",
+                {"message": "API key is required. Please configure your API key in Settings."},
             )
             return
         if not model:
-            await websocket.send_json(
-                {
-                    "type": "error",
-                    "data": {
-                        "message": "Model is required. Please select a model in Settings."
-                    },
-                }
+            await send_event(
+                websocket,
+                "error",
+                {"message": "Model is required. Please select a model in Settings."},
             )
             return
 
         document = documents.get(document_id)
         if document is None:
-            await websocket.send_json(
-                {"type": "error", "data": {"message": "Document not found"}}
+            await send_event(websocket, "error", {"message": "Document not found"})
+            return
+
+        try:
+            await asyncio.wait_for(query_slots.acquire(), timeout=QUERY_SLOT_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            await send_event(
+                websocket, "error", {"message": "Server busy. Please try again shortly."}
             )
             return
 
-        await websocket.send_json(
-            {"type": "status", "data": {"message": "RLM is exploring your document..."}}
-        )
+        try:
+            await send_event(
+                websocket, "status", {"message": "RLM is exploring your document..."}
+            )
 
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(
-            executor,
-            query_document,
-            str(document.get("text", "")),
-            question,
-            model,
-            api_key,
-        )
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                executor,
+                query_compressed_document,
+                document.compressed_text,
+                question,
+                model,
+                api_key,
+            )
+        finally:
+            query_slots.release()
 
         trajectory = result.get("trajectory", []) or []
         for entry in trajectory:
-            await websocket.send_json({"type": "iteration", "data": entry})
-            await asyncio.sleep(0.1)
+            await websocket.send_bytes(
+                b"".join((ITERATION_PREFIX, orjson.dumps(entry), ITERATION_SUFFIX))
+            )
 
         metrics = {
             "tokens": result.get("total_tokens", 0),
@@ -86,21 +112,20 @@ async def handle_query_ws(websocket: WebSocket, documents: dict[str, dict[str, A
             "sub_llm_calls": result.get("sub_llm_calls", 0),
         }
 
-        await websocket.send_json(
+        await send_event(
+            websocket,
+            "result",
             {
-                "type": "result",
-                "data": {
-                    "answer": result.get("answer", ""),
-                    "metrics": metrics,
-                },
-            }
+                "answer": result.get("answer", ""),
+                "metrics": metrics,
+            },
         )
     except WebSocketDisconnect:
         logger.info("WebSocket client disconnected")
     except Exception as exc:
         logger.exception("WebSocket handler error")
         try:
-            await websocket.send_json({"type": "error", "data": {"message": str(exc)}})
+            await send_event(websocket, "error", {"message": str(exc)})
         except Exception:
             # If the socket is already closed, there is nothing else to do.
             pass
@@ -234,6 +234,8 @@ export function useRlmQuery(): UseRlmQueryValue {
       setStatusMessage("Connecting to RLM...");
 
       const socket = new WebSocket(getRlmWsUrl());
+      // The backend sends events as binary (UTF-8 JSON) frames.
+      socket.binaryType = "arraybuffer";
       socketRef.current = socket;
 
       let hasTerminalEvent = false;
@@ -291,8 +293,11 @@ export function useRlmQuery(): UseRlmQueryValue {
 
         let payload: unknown;
         try {
-          payload =
-            typeof event.data === "string" ? JSON.parse(event.data) : event.data;
+          const raw =
+            typeof event.data === "string"
+              ? event.data
+              : new TextDecoder().decode(event.data as ArrayBuffer);
+          payload = JSON.parse(raw);
         } catch {
           setError("Received malformed data from the RLM service.");
           setStatusMessage("Received malformed stream data.");